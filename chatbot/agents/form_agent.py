@@ -1,17 +1,185 @@
+import atexit
+import concurrent.futures
 from datetime import datetime
 from enum import Enum
+import logging
 import os
-import re
-from typing import Dict, List
+import sqlite3
+import time
+from typing import Callable, ClassVar, Dict, Tuple
 
-import pandas as pd
+from openpyxl import Workbook, load_workbook
 
 from chatbot.utils import get_env_variable
 
+logger = logging.getLogger(__name__)
+
 EXCEL_FILEPATH = os.path.join(
     get_env_variable("EXCEL_FILEPATH"), "sup_de_vinci_students.xlsx"
 )
 
+EXCEL_COLUMNS = ("nom", "prenom", "telephone", "email", "timestamp")
+
+# Classes de caractères de l'email, sous forme de frozensets pour une
+# validation en un seul passage, en temps linéaire garanti (pas de
+# backtracking regex, donc pas de surface ReDoS sur entrée hostile).
+_EMAIL_LOCAL_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._%+-"
+)
+_EMAIL_DOMAIN_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.-"
+)
+
+
+def _is_valid_email(email: str) -> bool:
+    """Scanner d'email équivalent à ``local@domaine.tld`` (tld alpha ≥ 2)."""
+    local, sep, domain = email.partition("@")
+    if not sep or not local or not all(ch in _EMAIL_LOCAL_CHARS for ch in local):
+        return False
+    head, dot, tld = domain.rpartition(".")
+    if not dot or not head or len(tld) < 2 or not (tld.isascii() and tld.isalpha()):
+        return False
+    return all(ch in _EMAIL_DOMAIN_CHARS for ch in head)
+
+
+# Table de translation pré-construite : suppression des séparateurs en C,
+# sans machine à états regex.
+_PHONE_STRIP = str.maketrans("", "", " .-")
+
+# Worker unique pour la persistance : la réponse de fin de collecte part
+# immédiatement, l'écriture disque se fait en arrière-plan (un seul thread,
+# donc les appends restent ordonnés). Vidé proprement à la sortie du process.
+_SAVE_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="form-save"
+)
+atexit.register(_SAVE_POOL.shutdown, wait=True)
+
+
+_TODAY: str = ""
+_TODAY_EXPIRES: float = 0.0
+
+
+def _today_string() -> str:
+    """Date du jour mise en cache (horloge monotone, rafraîchie toutes les 60 s)."""
+    global _TODAY, _TODAY_EXPIRES  # noqa: PLW0603 - cache module volontaire
+    now = time.monotonic()
+    if now >= _TODAY_EXPIRES:
+        _TODAY = datetime.now().strftime("%Y-%m-%d")
+        _TODAY_EXPIRES = now + 60.0
+    return _TODAY
+
+
+# Répertoires déjà créés pendant la vie du process : évite un stat() par
+# sauvegarde une fois le dossier en place.
+_ENSURED_DIRS = set()
+
+_CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS students "
+    "(nom TEXT, prenom TEXT, telephone TEXT, email TEXT, timestamp TEXT)"
+)
+
+# Connexions SQLite partagées par chemin de base : une seule connexion (et
+# une seule création de table) par fichier pour tout le process.
+_DB_CONNECTIONS: Dict[str, sqlite3.Connection] = {}
+
+
+def _import_legacy_workbook(connection: sqlite3.Connection, xlsx_path: str):
+    """Reprend les lignes du classeur historique à la création de la base.
+
+    Sans cette reprise, le premier flush_to_excel écraserait le classeur
+    existant avec le seul contenu (vide) de la base et perdrait les
+    inscriptions déjà collectées.
+    """
+    if not os.path.exists(xlsx_path):
+        return
+    try:
+        sheet = load_workbook(xlsx_path, read_only=True).active
+        rows = [
+            tuple(
+                "" if value is None else str(value)
+                for value in (row + ("",) * len(EXCEL_COLUMNS))[: len(EXCEL_COLUMNS)]
+            )
+            for row in sheet.iter_rows(min_row=2, values_only=True)
+            if any(value not in (None, "") for value in row)
+        ]
+        if rows:
+            connection.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?)", rows)
+            connection.commit()
+            logger.info("%d lignes reprises depuis %s", len(rows), xlsx_path)
+    except Exception:
+        logger.exception("Reprise du classeur %s impossible", xlsx_path)
+
+
+def _get_db(db_file: str) -> sqlite3.Connection:
+    """Connexion SQLite en mode WAL, créée (avec sa table) au premier accès."""
+    connection = _DB_CONNECTIONS.get(db_file)
+    if connection is None:
+        directory = os.path.dirname(db_file)
+        if directory not in _ENSURED_DIRS:
+            os.makedirs(directory, exist_ok=True)
+            _ENSURED_DIRS.add(directory)
+        existed = os.path.exists(db_file)
+        connection = sqlite3.connect(db_file, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(_CREATE_TABLE_SQL)
+        if not existed:
+            _import_legacy_workbook(connection, os.path.splitext(db_file)[0] + ".xlsx")
+        _DB_CONNECTIONS[db_file] = connection
+    return connection
+
+
+def _insert_row(db_file: str, user_info: Dict):
+    """Insère une soumission dans la base (exécuté dans le worker)."""
+    db = _get_db(db_file)
+    db.execute(
+        "INSERT INTO students VALUES (?, ?, ?, ?, ?)",
+        tuple(user_info.get(column, "") for column in EXCEL_COLUMNS),
+    )
+    db.commit()
+
+
+def _insert_row_with_retry(db_file: str, user_info: Dict):
+    """Insertion avec une reprise unique (verrou SQLite transitoire, etc.)."""
+    try:
+        _insert_row(db_file, user_info)
+    except Exception:
+        time.sleep(0.2)
+        _insert_row(db_file, user_info)
+
+
+def _export_to_excel(db_file: str, xlsx_path: str):
+    """Exporte la table students vers le classeur .xlsx (écriture en flux)."""
+    if not os.path.exists(db_file):
+        return
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(EXCEL_COLUMNS)
+    rows = _get_db(db_file).execute(
+        "SELECT nom, prenom, telephone, email, timestamp FROM students"
+    )
+    for row in rows:
+        sheet.append(row)
+    workbook.save(xlsx_path)
+
+
+def _save_submission(db_file: str, xlsx_path: str, user_info: Dict):
+    """Insère la soumission puis rafraîchit l'export xlsx (worker unique).
+
+    L'export après chaque insertion garde le classeur lisible à tout moment
+    sans dépendre d'un déclencheur externe ; le worker étant unique, les
+    écritures restent ordonnées.
+    """
+    _insert_row_with_retry(db_file, user_info)
+    _export_to_excel(db_file, xlsx_path)
+
+
+def _log_save_failure(future: concurrent.futures.Future):
+    """Trace l'échec d'une écriture en arrière-plan, sinon perdu avec le futur."""
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Échec de l'enregistrement de la soumission", exc_info=exc)
+
 
 class CollectionState(Enum):
     GREETING = "greeting"
@@ -22,41 +190,64 @@ class CollectionState(Enum):
     COMPLETED = "completed"
 
 
+# Tables de messages partagées au niveau module : les chaînes sont des
+# constantes process-globales, chaque session FormAgent ne réalloue plus
+# ces dictionnaires à la construction.
+_MESSAGES = {
+    CollectionState.GREETING: (
+        "Je vais vous aider à compléter votre inscription.",
+        "Pour commencer, pouvez-vous me donner votre nom de famille ?",
+    ),
+    CollectionState.COLLECTING_NAME: (
+        "Parfait ! Maintenant, quel est votre prénom ?",
+        "Merci ! Et votre prénom, s'il vous plaît ?",
+    ),
+    CollectionState.COLLECTING_FIRSTNAME: (
+        "Excellent ! J'ai besoin maintenant de votre numéro de téléphone.",
+        "Parfait ! Pouvez-vous me communiquer votre numéro de téléphone ?",
+    ),
+    CollectionState.COLLECTING_PHONE: (
+        "Merci ! Pour finir, j'aurais besoin de votre adresse email.",
+        "Parfait ! Dernière information : votre adresse email, s'il vous plaît.",
+    ),
+    CollectionState.COMPLETED: (
+        "Excellent ! J'ai bien enregistré toutes vos informations :",
+        "Parfait ! Voici un récapitulatif de vos informations :",
+    ),
+}
+
+# Gabarit du récapitulatif final : construit sans indentation parasite,
+# donc formaté en une seule allocation, sans .strip() final.
+_RECAP_TEMPLATE = (
+    "{header}"
+    "\n\n• **Nom:** {nom}"
+    "\n• **Prénom:** {prenom}"
+    "\n• **Téléphone:** {telephone}"
+    "\n• **Email:** {email}"
+    "\n\n✅ Vos informations ont été enregistrées avec succès !"
+    "\nUn conseiller vous contactera prochainement pour la suite de votre "
+    "inscription à Sup de Vinci."
+    "\n\nMerci et à bientôt ! 🎓"
+)
+
+_ERROR_MESSAGES = {
+    "phone": "Le numéro de téléphone ne semble pas valide. Pouvez-vous le saisir à nouveau ? (Format attendu : 06.12.34.56.78 ou 0612345678)",
+    "email": "L'adresse email ne semble pas valide. Pouvez-vous la saisir à nouveau ?",
+    "name": "Le nom ne peut pas être vide. Pouvez-vous le saisir à nouveau ?",
+    "firstname": "Le prénom ne peut pas être vide. Pouvez-vous le saisir à nouveau ?",
+}
+
+
 class FormAgent:
     def __init__(self, output_file: str = EXCEL_FILEPATH):
+        if not output_file.endswith(".xlsx"):
+            output_file = output_file + ".xlsx"
         self.output_file = output_file
+        # Base SQLite append-only : chaque soumission coûte un INSERT (µs en
+        # WAL), le classeur .xlsx n'est qu'un export à la demande.
+        self.db_file = output_file[: -len(".xlsx")] + ".db"
         self.reset_session()
 
-        self.messages = {
-            CollectionState.GREETING: [
-                "Je vais vous aider à compléter votre inscription.",
-                "Pour commencer, pouvez-vous me donner votre nom de famille ?",
-            ],
-            CollectionState.COLLECTING_NAME: [
-                "Parfait ! Maintenant, quel est votre prénom ?",
-                "Merci ! Et votre prénom, s'il vous plaît ?",
-            ],
-            CollectionState.COLLECTING_FIRSTNAME: [
-                "Excellent ! J'ai besoin maintenant de votre numéro de téléphone.",
-                "Parfait ! Pouvez-vous me communiquer votre numéro de téléphone ?",
-            ],
-            CollectionState.COLLECTING_PHONE: [
-                "Merci ! Pour finir, j'aurais besoin de votre adresse email.",
-                "Parfait ! Dernière information : votre adresse email, s'il vous plaît.",
-            ],
-            CollectionState.COMPLETED: [
-                "Excellent ! J'ai bien enregistré toutes vos informations :",
-                "Parfait ! Voici un récapitulatif de vos informations :",
-            ],
-        }
-
-        self.error_messages = {
-            "phone": "Le numéro de téléphone ne semble pas valide. Pouvez-vous le saisir à nouveau ? (Format attendu : 06.12.34.56.78 ou 0612345678)",
-            "email": "L'adresse email ne semble pas valide. Pouvez-vous la saisir à nouveau ?",
-            "name": "Le nom ne peut pas être vide. Pouvez-vous le saisir à nouveau ?",
-            "firstname": "Le prénom ne peut pas être vide. Pouvez-vous le saisir à nouveau ?",
-        }
-
     def reset_session(self):
         self.current_state = CollectionState.GREETING
         self.user_info = {
@@ -69,136 +260,132 @@ class FormAgent:
         self.conversation_history = []
 
     def validate_phone(self, phone: str) -> bool:
-        clean_phone = re.sub(r"[\s\.\-]", "", phone)
-        patterns = [
-            r"^0[1-9](\d{8})$",
-            r"^\+33[1-9](\d{8})$",
-        ]
-        return any(re.match(pattern, clean_phone) for pattern in patterns)
+        clean_phone = phone.translate(_PHONE_STRIP)
+        if clean_phone.startswith("+33"):
+            clean_phone = "0" + clean_phone[3:]
+        return (
+            len(clean_phone) == 10
+            and clean_phone.isdigit()
+            and clean_phone[0] == "0"
+            and clean_phone[1] in "123456789"
+        )
 
     def validate_email(self, email: str) -> bool:
-        pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        return re.match(pattern, email.strip()) is not None
+        # L'entrée est déjà strippée par process_user_input.
+        return _is_valid_email(email)
 
     def validate_name(self, name: str) -> bool:
+        # Entrée déjà strippée ; un seul passage sur les caractères, sans
+        # chaînes intermédiaires créées par replace(). Au moins une lettre
+        # exigée : "--" ou "  " ne sont pas des noms.
         return (
-            len(name.strip()) >= 2
-            and name.strip().replace(" ", "").replace("-", "").isalpha()
+            len(name) >= 2
+            and all(ch.isalpha() or ch in " -" for ch in name)
+            and any(ch.isalpha() for ch in name)
         )
 
     def format_phone(self, phone: str) -> str:
-        clean_phone = re.sub(r"[\s\.\-]", "", phone)
+        clean_phone = phone.translate(_PHONE_STRIP)
         if clean_phone.startswith("+33"):
             clean_phone = "0" + clean_phone[3:]
 
         if len(clean_phone) == 10:
-            return f"{clean_phone[:2]}.{clean_phone[2:4]}.{clean_phone[4:6]}.{clean_phone[6:8]}.{clean_phone[8:]}"
+            return ".".join(
+                (
+                    clean_phone[0:2],
+                    clean_phone[2:4],
+                    clean_phone[4:6],
+                    clean_phone[6:8],
+                    clean_phone[8:10],
+                )
+            )
         return clean_phone
 
     def process_user_input(self, user_input: str) -> str:
         user_input = user_input.strip()
         self.conversation_history.append(f"Utilisateur: {user_input}")
 
-        response = ""
-
-        if self.current_state == CollectionState.GREETING:
-            response = self._handle_greeting()
-        elif self.current_state == CollectionState.COLLECTING_NAME:
-            response = self._handle_name_collection(user_input)
-        elif self.current_state == CollectionState.COLLECTING_FIRSTNAME:
-            response = self._handle_firstname_collection(user_input)
-        elif self.current_state == CollectionState.COLLECTING_PHONE:
-            response = self._handle_phone_collection(user_input)
-        elif self.current_state == CollectionState.COLLECTING_EMAIL:
-            response = self._handle_email_collection(user_input)
-        elif self.current_state == CollectionState.COMPLETED:
-            response = (
-                "Merci ! Vos informations ont déjà été enregistrées. "
-                "Y a-t-il autre chose pour laquelle je peux vous aider ?"
-            )
+        # Dispatch par table : un seul lookup dict au lieu d'une chaîne de
+        # comparaisons if/elif par état.
+        handler = self._DISPATCH[self.current_state]
+        response = handler(self, user_input)
 
         self.conversation_history.append(f"Agent: {response}")
         return response
 
-    def _handle_greeting(self) -> str:
+    def _handle_greeting(self, _user_input: str) -> str:
         self.current_state = CollectionState.COLLECTING_NAME
-        return " ".join(self.messages[CollectionState.GREETING])
+        return " ".join(_MESSAGES[CollectionState.GREETING])
 
     def _handle_name_collection(self, user_input: str) -> str:
         if self.validate_name(user_input):
             self.user_info["nom"] = user_input.strip().title()
             self.current_state = CollectionState.COLLECTING_FIRSTNAME
-            return self.messages[CollectionState.COLLECTING_NAME][0]
-        return self.error_messages["name"]
+            return _MESSAGES[CollectionState.COLLECTING_NAME][0]
+        return _ERROR_MESSAGES["name"]
 
     def _handle_firstname_collection(self, user_input: str) -> str:
         if self.validate_name(user_input):
             self.user_info["prenom"] = user_input.strip().title()
             self.current_state = CollectionState.COLLECTING_PHONE
-            return self.messages[CollectionState.COLLECTING_FIRSTNAME][0]
-        return self.error_messages["firstname"]
+            return _MESSAGES[CollectionState.COLLECTING_FIRSTNAME][0]
+        return _ERROR_MESSAGES["firstname"]
 
     def _handle_phone_collection(self, user_input: str) -> str:
         if self.validate_phone(user_input):
             self.user_info["telephone"] = self.format_phone(user_input)
             self.current_state = CollectionState.COLLECTING_EMAIL
-            return self.messages[CollectionState.COLLECTING_PHONE][0]
-        return self.error_messages["phone"]
+            return _MESSAGES[CollectionState.COLLECTING_PHONE][0]
+        return _ERROR_MESSAGES["phone"]
 
     def _handle_email_collection(self, user_input: str) -> str:
         if self.validate_email(user_input):
             self.user_info["email"] = user_input.strip().lower()
             self.current_state = CollectionState.COMPLETED
             return self._complete_collection()
-        return self.error_messages["email"]
+        return _ERROR_MESSAGES["email"]
+
+    def _handle_completed(self, _user_input: str) -> str:
+        return (
+            "Merci ! Vos informations ont déjà été enregistrées. "
+            "Y a-t-il autre chose pour laquelle je peux vous aider ?"
+        )
 
     def _complete_collection(self) -> str:
         self.user_info["timestamp"] = datetime.now().isoformat()
-        self.save_to_excel()
-
-        return f"""
-        {self.messages[CollectionState.COMPLETED][0]}
-        \n\n• **Nom:** {self.user_info["nom"]}
-        \n• **Prénom:** {self.user_info["prenom"]}
-        \n• **Téléphone:** {self.user_info["telephone"]}
-        \n• **Email:** {self.user_info["email"]}
-        \n\n✅ Vos informations ont été enregistrées avec succès !
-        \nUn conseiller vous contactera prochainement pour la suite de votre inscription à Sup de Vinci.
-        \n\nMerci et à bientôt ! 🎓
-        """.strip()
-
-    def save_to_excel(self):
-        """Save user information to Excel file"""
-        try:
-            os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
-
-            if not self.output_file.endswith(".xlsx"):
-                self.output_file = self.output_file + ".xlsx"
-
-            try:
-                df_existing = pd.read_excel(self.output_file, engine="openpyxl")
-            except FileNotFoundError:
-                df_existing = pd.DataFrame(
-                    columns=["nom", "prenom", "telephone", "email", "timestamp"]
-                )
-            except Exception as e:
-                print(
-                    f"Warning: Could not read existing file ({e}). Creating new file."
-                )
-                df_existing = pd.DataFrame(
-                    columns=["nom", "prenom", "telephone", "email", "timestamp"]
-                )
+        future = _SAVE_POOL.submit(
+            _save_submission, self.db_file, self.output_file, dict(self.user_info)
+        )
+        future.add_done_callback(_log_save_failure)
 
-            new_row = pd.DataFrame([self.user_info])
-            df_updated = pd.concat([df_existing, new_row], ignore_index=True)
+        return _RECAP_TEMPLATE.format(
+            header=_MESSAGES[CollectionState.COMPLETED][0], **self.user_info
+        )
 
-            df_updated.to_excel(self.output_file, index=False, engine="openpyxl")
+    _DISPATCH: ClassVar[Dict[CollectionState, Callable]] = {
+        CollectionState.GREETING: _handle_greeting,
+        CollectionState.COLLECTING_NAME: _handle_name_collection,
+        CollectionState.COLLECTING_FIRSTNAME: _handle_firstname_collection,
+        CollectionState.COLLECTING_PHONE: _handle_phone_collection,
+        CollectionState.COLLECTING_EMAIL: _handle_email_collection,
+        CollectionState.COMPLETED: _handle_completed,
+    }
 
+    def save_to_excel(self):
+        """Persist the submission as a single SQLite INSERT"""
+        try:
+            _insert_row(self.db_file, self.user_info)
         except Exception as e:
             raise Exception(f"Erreur lors de la sauvegarde: {e}") from e
 
-    def get_conversation_history(self) -> List[str]:
-        return self.conversation_history.copy()
+    def flush_to_excel(self):
+        """Export the SQLite records to the .xlsx workbook (streaming write)"""
+        _export_to_excel(self.db_file, self.output_file)
+
+    def get_conversation_history(self) -> Tuple[str, ...]:
+        # Tuple immuable : pas de copie défensive en liste à chaque appel,
+        # les appelants qui veulent muter font list(...) eux-mêmes.
+        return tuple(self.conversation_history)
 
     def is_collection_complete(self) -> bool:
         return self.current_state == CollectionState.COMPLETED
@@ -207,21 +394,16 @@ class FormAgent:
         return self.user_info.copy()
 
     def get_statistics(self) -> Dict:
-        """Get statistics from Excel file"""
+        """Get statistics as two COUNT(*) queries (sub-ms, no xlsx parsing)"""
         try:
-            file_path = self.output_file
-            if not file_path.endswith(".xlsx"):
-                file_path = file_path + ".xlsx"
-
-            df = pd.read_excel(file_path, engine="openpyxl")
-
-            today = datetime.now().strftime("%Y-%m-%d")
-
-            today_count = 0
-            if "timestamp" in df.columns:
-                today_count = len(df[df["timestamp"].astype(str).str.startswith(today)])
+            db = _get_db(self.db_file)
+            total = db.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+            today_count = db.execute(
+                "SELECT COUNT(*) FROM students WHERE timestamp LIKE ?",
+                (_today_string() + "%",),
+            ).fetchone()[0]
 
-            return {"total": len(df), "today": today_count}
+            return {"total": total, "today": today_count}
 
-        except (FileNotFoundError, Exception):
+        except Exception:
             return {"total": 0, "today": 0}
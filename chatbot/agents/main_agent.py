@@ -1,28 +1,268 @@
+from collections import deque
+import functools
+import json
 import logging
-import traceback
-from typing import Dict
-
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
 from openai import AzureOpenAI
 
-from chatbot.agents.doc_agent import DocAgent
-from chatbot.agents.form_agent import FormAgent
-from chatbot.agents.sdv_scrapper import WebScraper
-from chatbot.agents.web_agent import WebAgent
 from chatbot.utils import get_env_variable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=4)
+def _get_azure_client(api_key: str, endpoint: str, api_version: str) -> AzureOpenAI:
+    """
+    Fabrique mise en cache du client Azure OpenAI : le pool de connexions
+    httpx et le contexte TLS sont réutilisés entre les instances de
+    MainAgent au lieu d'être recréés à chaque session.
+    """
+    return AzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=api_key,
+    )
+
+
+INTENT_KEYWORDS = {
+    "web_info": [
+        "formation",
+        "formations",
+        "master",
+        "mastère",
+        "bachelor",
+        "campus",
+        "programme",
+        "programmes",
+        "école",
+        "ecole",
+        "étudiant",
+        "etudiant",
+        "cours",
+        "cursus",
+        "diplôme",
+        "diplome",
+        "informatique",
+        "supdevinci",
+        "sup de vinci",
+        "admission",
+        "admissions",
+        "spécialité",
+        "specialite",
+        "spécialités",
+        "specialites",
+        "domaine",
+        "filière",
+        "filiere",
+        "parcours",
+        "option",
+        "options",
+    ],
+    "documentation": [
+        "brochure",
+        "brochures",
+        "pdf",
+        "document",
+        "documents",
+        "guide",
+        "guides",
+        "procédure",
+        "procedure",
+        "manuel",
+        "livret",
+        "syllabus",
+        "programme détaillé",
+        "contenu",
+    ],
+    "contact": [
+        "contact",
+        "contacter",
+        "intéressé",
+        "interesse",
+        "candidature",
+        "postuler",
+        "inscription",
+        "inscrire",
+        "candidat",
+        "rdv",
+        "rendez-vous",
+        "information",
+        "renseignement",
+    ],
+    "general": [
+        "bonjour",
+        "salut",
+        "hello",
+        "bonsoir",
+        "aide",
+        "aider",
+        "merci",
+        "question",
+        "questions",
+    ],
+}
+
+# Alternation compilée une fois : un seul passage DFA sur l'entrée détecte
+# tous les mots clés simultanément, au lieu d'une recherche `in` par mot clé.
+# Les mots clés les plus longs d'abord pour que "formations" ne soit pas
+# absorbé par "formation".
+_INTENT_RE = re.compile(
+    "|".join(
+        "(?P<{}>{})".format(
+            intent,
+            "|".join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)),
+        )
+        for intent, keywords in INTENT_KEYWORDS.items()
+    )
+)
+
+
+def _substring_scanner(keywords):
+    """Compile une liste de mots clés en une alternation à passage unique.
+
+    Même sémantique que `any(kw in texte for kw in keywords)`, mais le texte
+    n'est balayé qu'une fois quel que soit le nombre de mots clés.
+    """
+    return re.compile("|".join(re.escape(kw) for kw in keywords))
+
+
+_FOLLOWUP_RE = _substring_scanner(
+    [
+        "autre",
+        "autres",
+        "plus",
+        "encore",
+        "également",
+        "aussi",
+        "existe",
+        "y a-t-il",
+        "quoi d'autre",
+        "d'autres",
+        "sinon",
+        "et",
+        "ou",
+        "comment",
+        "pourquoi",
+        "quand",
+        "où",
+    ]
+)
+
+_FALLBACK_FORMATION_RE = _substring_scanner(
+    ["formation", "master", "mastère", "programme"]
+)
+_FALLBACK_CONTACT_RE = _substring_scanner(["contact", "inscription", "candidature"])
+
+
+class _SemanticResponseCache:
+    """
+    Cache sémantique pour les réponses générales : la question est projetée
+    en embedding local normalisé L2, et une réponse déjà produite est
+    réutilisée si la similarité cosinus dépasse le seuil. Les entrées sont
+    cloisonnées par clé de contexte (type d'utilisateur) pour éviter de
+    servir la réponse d'un autre profil.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._embedder = None
+        self._vectors = np.empty((0, 384), dtype=np.float32)
+        self._scopes = []
+        self._responses = []
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embedding de la requête (embedder ONNX local, chargé au besoin)."""
+        if self._embedder is None:
+            # Même instance MiniLM que le WebAgent (cache ancré sur ROOT_DIR) :
+            # pas de troisième copie du modèle ONNX en mémoire.
+            from chatbot.agents.web_agent import _get_embeddings
+
+            self._embedder = _get_embeddings("sentence-transformers/all-MiniLM-L6-v2")
+        return np.asarray(self._embedder.embed_query(text), dtype=np.float32)
+
+    def lookup(self, query_vec: np.ndarray, scope) -> str:
+        """Meilleure réponse du même scope au-dessus du seuil, sinon None."""
+        if not self._responses:
+            return None
+        scores = self._vectors @ query_vec
+        best_index = -1
+        best_score = self.threshold
+        for i, score in enumerate(scores):
+            if score >= best_score and self._scopes[i] == scope:
+                best_index = i
+                best_score = score
+        return self._responses[best_index] if best_index >= 0 else None
+
+    def insert(self, query_vec: np.ndarray, scope, response: str):
+        if len(self._responses) >= self.max_entries:
+            self._vectors = self._vectors[1:]
+            self._scopes.pop(0)
+            self._responses.pop(0)
+        self._vectors = np.vstack([self._vectors, query_vec[np.newaxis, :]])
+        self._scopes.append(scope)
+        self._responses.append(response)
+
+
+# Partagé entre les sessions : les questions récurrentes ("quelles
+# formations ?") ne repassent pas par Azure à chaque visiteur.
+_RESPONSE_CACHE = _SemanticResponseCache()
+
+# Agents lourds et sans état conversationnel (vectorstores, modèles
+# d'embedding) : une seule instance pour tout le process, quel que soit le
+# nombre de sessions Streamlit. MainAgent reste l'enveloppe légère par
+# session (historique, contexte, FormAgent).
+_SHARED_AGENTS: Dict[str, object] = {}
+
+# Chaque session Streamlit tourne dans son propre thread : sans ce verrou,
+# deux premières sessions simultanées lanceraient chacune le scrape complet
+# et la construction Chroma sur les mêmes répertoires.
+_SHARED_AGENTS_LOCK = threading.Lock()
+
+
+def _shared_web_agent():
+    with _SHARED_AGENTS_LOCK:
+        if "web" not in _SHARED_AGENTS:
+            from chatbot.agents.sdv_scrapper import WebScraper
+            from chatbot.agents.web_agent import WebAgent
+
+            scraper = WebScraper("https://www.supdevinci.fr/", 100)
+            scraper.run_full_scrape()
+            _SHARED_AGENTS["web"] = (scraper, WebAgent())
+        return _SHARED_AGENTS["web"]
+
+
+def _shared_doc_agent():
+    with _SHARED_AGENTS_LOCK:
+        if "doc" not in _SHARED_AGENTS:
+            from chatbot.agents.doc_agent import DocAgent
+
+            _SHARED_AGENTS["doc"] = DocAgent()
+        return _SHARED_AGENTS["doc"]
+
+
 class MainAgent:
     def __init__(self):
         """Initialize the unified main agent with all specialized agents"""
         self.client = self._create_azure_client()
-        self.conversation_history = []
+        # Mémoire à deux niveaux : fenêtre glissante bornée (6 paires
+        # question/réponse) pour le court terme, plus un résumé roulant des
+        # tours évincés pour le long terme — le coût en tokens par appel
+        # reste constant quelle que soit la durée de la session.
+        self.conversation_history = deque(maxlen=12)
+        self.rolling_summary = ""
+        self._summary_backlog = []
         self.user_context = {}
         self.deployment_name = None
-
-        self._initialize_agents()
+        self.web_scraper = None
 
         self.current_agent = None
         self.collection_in_progress = False
@@ -30,12 +270,9 @@ class MainAgent:
         self.conversation_context = {
             "topic": None,
             "user_type": None,
-            "previous_questions": [],
+            "previous_questions": deque(maxlen=5),
         }
 
-        self.web_scraper = WebScraper("https://www.supdevinci.fr/", 100)
-        self.web_scraper.run_full_scrape()
-
     def _create_azure_client(self):
         """Create an Azure OpenAI client instance"""
         try:
@@ -46,42 +283,70 @@ class MainAgent:
 
             self.deployment_name = deployment_name
 
-            return AzureOpenAI(
-                api_version=api_version,
-                azure_endpoint=endpoint,
-                api_key=api_key,
-            )
+            return _get_azure_client(api_key, endpoint, api_version)
         except Exception as e:
             logger.error(f"Failed to create Azure OpenAI client: {e}")
             raise
 
-    def _initialize_agents(self):
-        """Initialize all specialized agents with better error handling"""
-        self.web_agent = None
-        self.doc_agent = None
-        self.information_collector = None
-
+    # Agents spécialisés construits paresseusement : une session qui ne
+    # sort pas des réponses générales ne paie ni le scraping du site, ni le
+    # chargement des vectorstores. Les appelants qui testent
+    # `if not self.web_agent:` fonctionnent tels quels — le premier accès
+    # déclenche la construction, un échec est mémorisé comme None.
+    # Les imports sont différés eux aussi : importer ce module (ce que fait
+    # la page Streamlit au démarrage) ne charge ni torch ni langchain.
+
+    @functools.cached_property
+    def web_agent(self):
+        """Build or fetch the shared web agent on first use"""
         try:
-            self.web_agent = WebAgent()
+            self.web_scraper, agent = _shared_web_agent()
             logger.info("Web Agent initialized successfully")
+            return agent
         except Exception as e:
             logger.error(f"Failed to initialize Web Agent: {e}")
+            return None
 
+    @functools.cached_property
+    def doc_agent(self):
+        """Build or fetch the shared documentation agent on first use"""
         try:
-            self.doc_agent = DocAgent()
+            agent = _shared_doc_agent()
             logger.info("Doc Agent initialized successfully")
+            return agent
         except Exception as e:
             logger.error(f"Failed to initialize Doc Agent: {e}")
+            return None
 
+    @functools.cached_property
+    def information_collector(self):
+        """Build the information collector agent on first use"""
         try:
-            self.information_collector = FormAgent()
+            from chatbot.agents.form_agent import FormAgent
+
+            agent = FormAgent()
             logger.info("Information Collector Agent initialized successfully")
+            return agent
         except Exception as e:
             logger.error(f"Failed to initialize Information Collector Agent: {e}")
-
-    def detect_intent(self, user_input: str) -> str:
+            return None
+
+    @property
+    def collection_state(self):
+        """Current information-collection state, or None when inactive"""
+        # Lecture directe dans __dict__ : ne déclenche pas la construction
+        # paresseuse du FormAgent quand aucune collecte n'a commencé.
+        collector = self.__dict__.get("information_collector")
+        if collector is None:
+            return None
+        return getattr(collector, "current_state", None)
+
+    def detect_intent(self, user_input: str, user_lower: Optional[str] = None) -> str:
         """Enhanced intent detection with conversation context"""
-        user_lower = user_input.lower()
+        # L'appelant peut fournir l'entrée déjà passée en minuscules pour
+        # éviter de la recalculer à chaque étape du tour.
+        if user_lower is None:
+            user_lower = user_input.lower()
 
         if (
             self.collection_in_progress
@@ -90,92 +355,13 @@ class MainAgent:
         ):
             return "contact_collection"
 
-        if self.last_intent and self._is_followup_question(user_input):
+        if self.last_intent and self._is_followup_question(user_lower):
             return self.last_intent
 
-        intentions = {
-            "web_info": [
-                "formation",
-                "formations",
-                "master",
-                "mastère",
-                "bachelor",
-                "campus",
-                "programme",
-                "programmes",
-                "école",
-                "ecole",
-                "étudiant",
-                "etudiant",
-                "cours",
-                "cursus",
-                "diplôme",
-                "diplome",
-                "informatique",
-                "supdevinci",
-                "sup de vinci",
-                "admission",
-                "admissions",
-                "spécialité",
-                "specialite",
-                "spécialités",
-                "specialites",
-                "domaine",
-                "filière",
-                "filiere",
-                "parcours",
-                "option",
-                "options",
-            ],
-            "documentation": [
-                "brochure",
-                "brochures",
-                "pdf",
-                "document",
-                "documents",
-                "guide",
-                "guides",
-                "procédure",
-                "procedure",
-                "manuel",
-                "livret",
-                "syllabus",
-                "programme détaillé",
-                "contenu",
-            ],
-            "contact": [
-                "contact",
-                "contacter",
-                "intéressé",
-                "interesse",
-                "candidature",
-                "postuler",
-                "inscription",
-                "inscrire",
-                "candidat",
-                "rdv",
-                "rendez-vous",
-                "information",
-                "renseignement",
-            ],
-            "general": [
-                "bonjour",
-                "salut",
-                "hello",
-                "bonsoir",
-                "aide",
-                "aider",
-                "merci",
-                "question",
-                "questions",
-            ],
-        }
-
         intent_scores = {}
-        for intent, keywords in intentions.items():
-            score = sum(1 for keyword in keywords if keyword in user_lower)
-            if score > 0:
-                intent_scores[intent] = score
+        for match in _INTENT_RE.finditer(user_lower):
+            intent = match.lastgroup
+            intent_scores[intent] = intent_scores.get(intent, 0) + 1
 
         if intent_scores:
             detected_intent = max(intent_scores, key=intent_scores.get)
@@ -184,29 +370,9 @@ class MainAgent:
 
         return "general"
 
-    def _is_followup_question(self, user_input: str) -> bool:
-        """Check if the user input is a follow-up question"""
-        followup_indicators = [
-            "autre",
-            "autres",
-            "plus",
-            "encore",
-            "également",
-            "aussi",
-            "existe",
-            "y a-t-il",
-            "quoi d'autre",
-            "d'autres",
-            "sinon",
-            "et",
-            "ou",
-            "comment",
-            "pourquoi",
-            "quand",
-            "où",
-        ]
-        user_lower = user_input.lower()
-        return any(indicator in user_lower for indicator in followup_indicators)
+    def _is_followup_question(self, user_lower: str) -> bool:
+        """Check if the (lowercased) user input is a follow-up question"""
+        return _FOLLOWUP_RE.search(user_lower) is not None
 
     def _route_to_agent(self, intent: str) -> str:
         """Route to the appropriate agent based on intent"""
@@ -221,15 +387,17 @@ class MainAgent:
 
     def generate_response(self, user_input: str) -> Dict:
         """Generate a comprehensive response using the appropriate agent"""
+        # Une seule passe de minuscules par tour, partagée par la détection
+        # d'intention, le contexte et les réponses de secours.
+        user_lower = user_input.lower()
         try:
+            # deque bornée : l'éviction du plus ancien est O(1), sans pop(0).
             self.conversation_context["previous_questions"].append(user_input)
-            if len(self.conversation_context["previous_questions"]) > 5:
-                self.conversation_context["previous_questions"].pop(0)
 
-            intent = self.detect_intent(user_input)
+            intent = self.detect_intent(user_input, user_lower)
             target_agent = self._route_to_agent(intent)
 
-            self.conversation_history.append({"role": "user", "content": user_input})
+            self._remember({"role": "user", "content": user_input})
 
             response = ""
             agent_used = target_agent
@@ -250,12 +418,12 @@ class MainAgent:
                 agent_used = "action_agent"
 
             else:
-                response = self._generate_general_response_safe(user_input)
+                response = self._generate_general_response_safe(user_input, user_lower)
                 agent_used = "main_agent"
 
-            self.conversation_history.append({"role": "assistant", "content": response})
+            self._remember({"role": "assistant", "content": response})
 
-            self._update_conversation_context(intent, user_input)
+            self._update_conversation_context(intent, user_lower)
 
             return {
                 "response": response,
@@ -268,10 +436,9 @@ class MainAgent:
             }
 
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error generating response")
 
-            error_response = self._get_fallback_response(user_input)
+            error_response = self._get_fallback_response(user_lower)
 
             return {
                 "response": error_response,
@@ -282,6 +449,44 @@ class MainAgent:
                 "error": str(e),
             }
 
+    def _remember(self, message: dict):
+        """Append a message to the sliding window, summarizing evicted turns"""
+        if len(self.conversation_history) == self.conversation_history.maxlen:
+            self._summary_backlog.append(self.conversation_history[0])
+        self.conversation_history.append(message)
+
+        if len(self._summary_backlog) >= 4:
+            self._summarize_backlog()
+
+    def _summarize_backlog(self):
+        """Fold evicted messages into the rolling summary with a cheap LLM call"""
+        try:
+            transcript = "\n".join(
+                f"{msg['role']}: {msg['content']}" for msg in self._summary_backlog
+            )
+            response = self.client.chat.completions.create(
+                model=self.deployment_name,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": (
+                            "Résume en 3 phrases maximum les points importants de "
+                            "cet échange, en conservant le résumé précédent s'il "
+                            "reste pertinent.\n"
+                            f"Résumé précédent : {self.rolling_summary or 'aucun'}\n"
+                            f"Échange :\n{transcript}"
+                        ),
+                    }
+                ],
+                temperature=0,
+                max_tokens=150,
+            )
+            self.rolling_summary = response.choices[0].message.content
+            self._summary_backlog = []
+        except Exception as e:
+            logger.warning(f"Summary update failed: {e}")
+            self._summary_backlog = []
+
     def _handle_web_agent_safe(self, user_input: str) -> str:
         """Handle web agent queries with error handling"""
         try:
@@ -351,59 +556,182 @@ class MainAgent:
                 {},
             )
 
-    def _generate_general_response_safe(self, user_input: str) -> str:
+    def _generate_general_response_safe(self, user_input: str, user_lower: str) -> str:
         """Generate a general response with error handling"""
         try:
             if not self.client:
-                return self._get_fallback_response(user_input)
+                return self._get_fallback_response(user_lower)
+
+            # Cache sémantique, limité au début de conversation : au-delà,
+            # la réponse dépend de l'historique et ne doit pas être partagée.
+            cache_scope = None
+            query_vec = None
+            if len(self.conversation_history) <= 3:
+                cache_scope = self.conversation_context.get("user_type")
+                try:
+                    query_vec = _RESPONSE_CACHE.embed(user_input)
+                    cached = _RESPONSE_CACHE.lookup(query_vec, cache_scope)
+                    if cached is not None:
+                        return cached
+                except Exception as e:
+                    logger.warning(f"Semantic cache unavailable: {e}")
+                    query_vec = None
 
-            system_prompt = f"""Tu es un assistant virtuel de l'école Sup de Vinci, une école d'informatique prestigieuse.
+            response = self.client.chat.completions.create(
+                model=self.deployment_name,
+                messages=self._build_general_messages(user_input),
+                temperature=0.3,
+                max_tokens=1000,
+            )
+
+            answer = response.choices[0].message.content
+            if query_vec is not None:
+                _RESPONSE_CACHE.insert(query_vec, cache_scope, answer)
+            return answer
+
+        except Exception as e:
+            logger.error(f"LLM response error: {e}")
+            return self._get_fallback_response(user_lower)
+
+    def _build_general_messages(self, user_input: str) -> list:
+        """Assemble the system prompt and history for the general path"""
+        # JSON compact plutôt que repr Python : moins de tokens facturés par
+        # tour pour le même contenu (pas de quotes doublées ni de deque(...)).
+        context = self.conversation_context
+        context_json = json.dumps(
+            {**context, "previous_questions": list(context["previous_questions"])},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+        system_prompt = f"""Tu es un assistant virtuel de l'école Sup de Vinci, une école d'informatique prestigieuse.
 
             Tu es accueillant, professionnel et serviable. Tu peux aider avec :
             - Des informations générales sur l'école (formations, admissions, campus)
             - Des questions sur la documentation (règlements, brochures)
             - La mise en contact pour les candidatures ou partenariats.
 
-            Contexte de conversation actuel: {self.conversation_context}
+            Contexte de conversation actuel: {context_json}
 
             Si une question nécessite des informations spécifiques que tu n'as pas, propose des alternatives ou oriente vers le service approprié.
             Reste dans le contexte de Sup de Vinci et de l'enseignement informatique.
 
             Si l'utilisateur pose des questions de suivi, garde le contexte de la conversation précédente."""
 
-            messages = [{"role": "system", "content": system_prompt}]
-
-            recent_history = (
-                self.conversation_history[-6:]
-                if len(self.conversation_history) > 6
-                else self.conversation_history
+        if self.rolling_summary:
+            system_prompt += (
+                f"\n\nRésumé des échanges précédents : {self.rolling_summary}"
             )
-            messages.extend(recent_history)
 
-            if not messages or messages[-1]["content"] != user_input:
-                messages.append({"role": "user", "content": user_input})
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(self.conversation_history)
 
-            response = self.client.chat.completions.create(
+        if not messages or messages[-1]["content"] != user_input:
+            messages.append({"role": "user", "content": user_input})
+
+        return messages
+
+    def stream_general_response(self, user_input: str):
+        """Yield the general reply chunk by chunk (stream=True).
+
+        Perceived latency drops to time-to-first-token instead of the full
+        completion time; the assembled reply is appended to history once the
+        stream ends. Carries the same per-turn bookkeeping (previous
+        questions, conversation context) as generate_response.
+        """
+        user_lower = user_input.lower()
+        self.conversation_context["previous_questions"].append(user_input)
+        self._remember({"role": "user", "content": user_input})
+        parts = []
+        try:
+            stream = self.client.chat.completions.create(
                 model=self.deployment_name,
-                messages=messages,
+                messages=self._build_general_messages(user_input),
                 temperature=0.3,
                 max_tokens=1000,
+                stream=True,
             )
-
-            return response.choices[0].message.content
-
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
         except Exception as e:
-            logger.error(f"LLM response error: {e}")
-            return self._get_fallback_response(user_input)
+            logger.error(f"LLM streaming error: {e}")
+            fallback = self._get_fallback_response(user_lower)
+            parts.append(fallback)
+            yield fallback
+
+        self._remember({"role": "assistant", "content": "".join(parts)})
+        self._update_conversation_context("general", user_lower)
+
+    def batch_generate(
+        self, inputs: List[str], poll_interval: int = 30, timeout: int = 24 * 3600
+    ) -> List[str]:
+        """Run a bulk list of prompts through the Azure OpenAI Batch API.
+
+        Meant for offline jobs (re-scoring scraped pages, bulk evaluation
+        runs): batched requests cost half the interactive price and get far
+        higher throughput quotas. Blocks until the batch completes — never
+        call this on the per-turn path.
+        """
+        tasks = [
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/chat/completions",
+                "body": {
+                    "model": self.deployment_name,
+                    "messages": [{"role": "user", "content": text}],
+                    "temperature": 0.3,
+                    "max_tokens": 1000,
+                },
+            }
+            for i, text in enumerate(inputs)
+        ]
 
-    def _get_fallback_response(self, user_input: str) -> str:
-        """Provide contextual fallback responses"""
-        user_lower = user_input.lower()
+        with tempfile.NamedTemporaryFile(
+            "wb", suffix=".jsonl", delete=False
+        ) as jsonl_file:
+            for task in tasks:
+                jsonl_file.write((json.dumps(task) + "\n").encode("utf-8"))
+            input_path = jsonl_file.name
 
-        if any(
-            word in user_lower
-            for word in ["formation", "master", "mastère", "programme"]
-        ):
+        try:
+            with open(input_path, "rb") as f:
+                batch_file = self.client.files.create(file=f, purpose="batch")
+        finally:
+            os.unlink(input_path)
+
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/chat/completions",
+            completion_window="24h",
+        )
+
+        deadline = time.monotonic() + timeout
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Batch {batch.id} still '{batch.status}' after {timeout}s"
+                )
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+        answers: List[str] = [""] * len(inputs)
+        raw = self.client.files.content(batch.output_file_id).text
+        for line in raw.splitlines():
+            result = json.loads(line)
+            index = int(result["custom_id"])
+            choices = result["response"]["body"]["choices"]
+            answers[index] = choices[0]["message"]["content"]
+        return answers
+
+    def _get_fallback_response(self, user_lower: str) -> str:
+        """Provide contextual fallback responses from the lowercased input"""
+        if _FALLBACK_FORMATION_RE.search(user_lower):
             return """Sup de Vinci propose plusieurs formations en informatique :
 
 • **Mastères spécialisés** en développement, cybersécurité, data science
@@ -412,9 +740,7 @@ class MainAgent:
 
 Pour plus de détails spécifiques, puis-je recueillir vos coordonnées pour qu'un conseiller vous recontacte ?"""
 
-        if any(
-            word in user_lower for word in ["contact", "inscription", "candidature"]
-        ):
+        if _FALLBACK_CONTACT_RE.search(user_lower):
             return """Je peux vous aider avec votre candidature !
 
 Pour commencer votre inscription chez Sup de Vinci, j'aurais besoin de quelques informations :
@@ -433,22 +759,17 @@ Je peux vous renseigner sur :
 
 Que souhaitez-vous savoir ?"""
 
-    def _update_conversation_context(self, intent: str, user_input: str):
+    def _update_conversation_context(self, intent: str, user_lower: str):
         """Update conversation context for better follow-up handling"""
         if intent == "web_info":
-            if "formation" in user_input.lower():
+            if "formation" in user_lower:
                 self.conversation_context["topic"] = "formations"
-            elif "campus" in user_input.lower():
+            elif "campus" in user_lower:
                 self.conversation_context["topic"] = "campus"
 
-        if any(
-            word in user_input.lower()
-            for word in ["étudiant", "candidat", "inscription"]
-        ):
+        if any(word in user_lower for word in ("étudiant", "candidat", "inscription")):
             self.conversation_context["user_type"] = "student"
-        elif any(
-            word in user_input.lower() for word in ["entreprise", "recruteur", "stage"]
-        ):
+        elif any(word in user_lower for word in ("entreprise", "recruteur", "stage")):
             self.conversation_context["user_type"] = "company"
 
     def _get_collection_status(self) -> dict:
@@ -466,7 +787,9 @@ Que souhaitez-vous savoir ?"""
 
     def reset_conversation(self):
         """Reset conversation history and states"""
-        self.conversation_history = []
+        self.conversation_history = deque(maxlen=12)
+        self.rolling_summary = ""
+        self._summary_backlog = []
         self.user_context = {}
         self.current_agent = None
         self.collection_in_progress = False
@@ -474,18 +797,22 @@ Que souhaitez-vous savoir ?"""
         self.conversation_context = {
             "topic": None,
             "user_type": None,
-            "previous_questions": [],
+            "previous_questions": deque(maxlen=5),
         }
 
-        if self.information_collector:
-            self.information_collector.reset_session()
+        # Sans déclencher la construction paresseuse : rien à réinitialiser
+        # si le collecteur n'a jamais servi.
+        collector = self.__dict__.get("information_collector")
+        if collector:
+            collector.reset_session()
 
     def get_agent_status(self) -> dict:
-        """Get status of all agents"""
+        """Get status of all agents (without triggering their lazy build)"""
         return {
-            "web_agent": self.web_agent is not None,
-            "doc_agent": self.doc_agent is not None,
-            "information_collector": self.information_collector is not None,
+            "web_agent": self.__dict__.get("web_agent") is not None,
+            "doc_agent": self.__dict__.get("doc_agent") is not None,
+            "information_collector": self.__dict__.get("information_collector")
+            is not None,
             "azure_client": self.client is not None,
             "deployment_name": self.deployment_name,
         }
@@ -493,9 +820,10 @@ Que souhaitez-vous savoir ?"""
     def get_conversation_summary(self) -> dict:
         """Get conversation summary and statistics"""
         stats = {}
-        if self.information_collector:
+        collector = self.__dict__.get("information_collector")
+        if collector:
             try:
-                stats = self.information_collector.get_statistics()
+                stats = collector.get_statistics()
             except Exception:
                 stats = {"total": 0, "today": 0}
 
@@ -1,65 +1,178 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
-import shutil
+import re
 from typing import List, Set
 from urllib.parse import urldefrag, urljoin, urlparse
 
-from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+from selectolax.parser import HTMLParser
+from urllib3.util.retry import Retry
 
 from chatbot.utils import get_env_variable
 
 _ROOT_DIR = get_env_variable("ROOT_DIR")
 
+# Nombre de téléchargements simultanés : le crawl est borné par les
+# allers-retours réseau, pas par le CPU, donc on parallélise les fetches
+# avec un pool de threads borné (surchargeable via SCRAPE_WORKERS).
+_FETCH_WORKERS = int(os.getenv("SCRAPE_WORKERS", "16"))
+
+# Session partagée : les sockets keep-alive sont réutilisées entre les
+# requêtes (une poignée de main TCP+TLS pour tout le crawl au lieu d'une
+# par page), avec retries sur les erreurs transitoires et corps compressés.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=_FETCH_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    ),
+)
+SESSION.headers.update(
+    {
+        "Accept-Encoding": "gzip, deflate",
+        "User-Agent": "supdevinci-chatbot-scraper/1.0",
+    }
+)
+
+
+EXCLUDE_PATTERNS = (
+    "/offres-emploi/",
+    "/formation/",
+    "/evenement/",
+    "/conference/",
+    "/campus/",
+    "/author/",
+    "/agenda-",
+    "/actualites/",
+    "/salon-jpo/",
+    "/non-classe/",
+    "equipe-",
+    "cookies",
+    "mentions-legales",
+    "privacy",
+    "documentation",
+    "recrutement",
+    "certifications",
+    "/wp-content/",
+)
+
+# Alternation compilée une fois : un seul scan C de l'URL au lieu de 18
+# recherches de sous-chaîne, dans la boucle interne du BFS.
+_EXCLUDE_RE = re.compile("|".join(map(re.escape, EXCLUDE_PATTERNS)))
+
+_BAD_SUFFIXES = (".pdf", ".jpg", ".png", ".zip")
+
+# Plafond de lecture par page : borne le coût de parse et la mémoire si un
+# binaire passe au travers de la liste d'extensions exclues.
+_MAX_BODY_BYTES = 2 * 1024 * 1024
+
+
+def _parse_html(body: bytes, encoding: str) -> HTMLParser:
+    """Arbre selectolax depuis les octets bruts du corps HTTP.
+
+    En UTF-8 (ou sans charset déclaré), les octets passent tels quels au
+    parseur C — pas de transcodage unicode côté Python. Seuls les charsets
+    exotiques déclarés par le serveur paient un décodage explicite.
+    """
+    if encoding and encoding.lower() not in ("utf-8", "utf8"):
+        return HTMLParser(body.decode(encoding, "replace"))
+    return HTMLParser(body)
+
 
 class WebScraper:
     def __init__(self, base_url: str, max_pages: int = 100):
         self.base_url = base_url
+        self.base_domain = urlparse(base_url).netloc
         self.max_pages = max_pages
-        self.exclude_patterns = [
-            "/offres-emploi/",
-            "/formation/",
-            "/evenement/",
-            "/conference/",
-            "/campus/",
-            "/author/",
-            "/agenda-",
-            "/actualites/",
-            "/salon-jpo/",
-            "/non-classe/",
-            "equipe-",
-            "cookies",
-            "mentions-legales",
-            "privacy",
-            "documentation",
-            "recrutement",
-            "certifications",
-            "/wp-content/",
-        ]
         self.visited = set()
         self.found_links = set()
-        self.to_visit = [base_url]
+        # File FIFO (vrai BFS) ; `enqueued` déduplique à l'insertion, les
+        # URLs de la file sont donc uniques et déjà défragmentées.
+        self.to_visit = deque([base_url])
+        self.enqueued = {base_url}
+        # Texte extrait pendant la collecte : la passe markdown relit depuis
+        # la mémoire au lieu de retélécharger et re-parser chaque page
+        # (~100 pages x qq Ko, négligeable en RAM). Écritures sur des clés
+        # distinctes, atomiques sous le GIL.
+        self.text_cache = {}
+        # Manifeste des runs précédents : url -> {etag, last_modified, sha,
+        # links}. Permet les GET conditionnels (304 = page inchangée, on
+        # réutilise le .md et les liens du manifeste sans re-parser).
+        self.manifest = {}
+        self.new_manifest = {}
+        self.unchanged = set()
+        self.manifest_path = None
 
     def is_valid_internal_link(self, link: str) -> bool:
         """Vérifie si un lien est valide et interne au site."""
         full_url = urljoin(self.base_url, link)
         parsed = urlparse(full_url)
-        domain = urlparse(self.base_url).netloc
 
         return (
-            parsed.netloc == domain
-            and not any(pattern in full_url for pattern in self.exclude_patterns)
-            and not full_url.endswith((".pdf", ".jpg", ".png", ".zip"))
+            parsed.netloc == self.base_domain
+            and _EXCLUDE_RE.search(full_url) is None
+            and not parsed.path.lower().endswith(_BAD_SUFFIXES)
         )
 
     def crawl_page(self, url: str) -> List[str]:
-        """Récupère tous les liens valides d'une page."""
+        """Récupère tous les liens valides d'une page.
+
+        Un seul parse selectolax (lexbor, en C) par page : les liens sont
+        extraits d'abord, puis le texte est tiré du même arbre et mis en
+        cache pour la passe markdown. Avec une entrée de manifeste, le
+        GET est conditionnel : sur 304 (ou corps au hash identique) la page
+        est marquée inchangée, son .md est réutilisé et le parse est sauté.
+        """
         try:
-            response = requests.get(url, timeout=10)
+            entry = self.manifest.get(url)
+            headers = {}
+            if entry:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            # stream=True : les en-têtes suffisent pour écarter les 304 et
+            # les contenus non HTML sans télécharger le corps.
+            response = SESSION.get(url, timeout=10, headers=headers, stream=True)
+            if response.status_code == 304 and entry:
+                response.close()
+                self.new_manifest[url] = entry
+                self.unchanged.add(url)
+                return entry.get("links", [])
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
+
+            if not response.headers.get("Content-Type", "").startswith("text/html"):
+                response.close()
+                return []
+
+            body = response.raw.read(_MAX_BODY_BYTES, decode_content=True)
+            body_sha = hashlib.blake2b(body, digest_size=16).hexdigest()
+            new_entry = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha": body_sha,
+            }
+            if entry and entry.get("sha") == body_sha:
+                # Serveur sans support des GET conditionnels : le hash du
+                # corps suffit à sauter le parse.
+                new_entry["links"] = entry.get("links", [])
+                self.new_manifest[url] = new_entry
+                self.unchanged.add(url)
+                return new_entry["links"]
+
+            tree = _parse_html(body, response.encoding)
 
             links = [
-                a.get("href") for a in soup.find_all("a", href=True) if a.get("href")
+                node.attributes.get("href")
+                for node in tree.css("a[href]")
+                if node.attributes.get("href")
             ]
             valid_links = []
 
@@ -68,6 +181,13 @@ class WebScraper:
                 if self.is_valid_internal_link(link):
                     valid_links.append(full_link)
 
+            # extract_text_from_tree élague l'arbre : à faire après
+            # l'extraction des liens.
+            self.text_cache[url] = self.extract_text_from_tree(tree)
+
+            new_entry["links"] = valid_links
+            self.new_manifest[url] = new_entry
+
             return valid_links
 
         except Exception as e:
@@ -75,35 +195,45 @@ class WebScraper:
             return []
 
     def collect_all_links(self) -> Set[str]:
-        """Collecte tous les liens du site jusqu'à MAX_PAGES."""
+        """Collecte tous les liens du site jusqu'à MAX_PAGES.
+
+        BFS par vagues : chaque vague télécharge sa frontière en parallèle
+        (pool borné), puis les liens découverts sont dépilés séquentiellement
+        — `visited` et `to_visit` ne sont touchés que par le thread principal.
+        """
         print("Collecte des liens...\n")
 
-        while self.to_visit and len(self.visited) < self.max_pages:
-            current_url = urldefrag(self.to_visit.pop())[0]
+        with ThreadPoolExecutor(max_workers=_FETCH_WORKERS) as executor:
+            while self.to_visit and len(self.visited) < self.max_pages:
+                batch = []
+                while self.to_visit and len(self.visited) + len(batch) < self.max_pages:
+                    current_url = self.to_visit.popleft()
+                    if current_url not in self.visited:
+                        batch.append(current_url)
 
-            if current_url in self.visited:
-                continue
+                self.visited.update(batch)
 
-            self.visited.add(current_url)
+                for page_links in executor.map(self.crawl_page, batch):
+                    for link in page_links:
+                        clean_link = urldefrag(link)[0]
+                        if clean_link not in self.enqueued:
+                            self.enqueued.add(clean_link)
+                            self.to_visit.append(clean_link)
+                            self.found_links.add(clean_link)
 
-            page_links = self.crawl_page(current_url)
+        return self.found_links
 
-            for link in page_links:
-                clean_link = urldefrag(link)[0]
-                if clean_link not in self.visited:
-                    self.to_visit.append(clean_link)
-                    self.found_links.add(clean_link)
+    def extract_text_from_tree(self, tree: HTMLParser) -> str:
+        """Extrait le texte propre d'un arbre déjà parsé (élague l'arbre)."""
+        for tag in tree.css("script, style, noscript, nav, footer, aside"):
+            tag.decompose()
 
-        return self.found_links
+        node = tree.body or tree.root
+        return node.text(separator="\n", strip=True) if node else ""
 
     def extract_text_from_html(self, html: str) -> str:
         """Extrait le texte propre d'un contenu HTML."""
-        soup = BeautifulSoup(html, "html.parser")
-
-        for tag in soup(["script", "style", "noscript", "nav", "footer", "aside"]):
-            tag.decompose()
-
-        return soup.get_text(separator="\n", strip=True)
+        return self.extract_text_from_tree(HTMLParser(html))
 
     def url_to_filename(self, url: str) -> str:
         """Convertit une URL en nom de fichier valide."""
@@ -111,11 +241,19 @@ class WebScraper:
         return "accueil.md" if not path else f"{path}.md"
 
     def scrape_page_content(self, url: str) -> str:
-        """Récupère et extrait le contenu textuel d'une page."""
+        """Extrait le contenu textuel d'une page (cache du crawl, sinon fetch)."""
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return self.extract_text_from_html(response.text)
+            text = self.text_cache.get(url)
+            if text is None:
+                response = SESSION.get(url, timeout=10, stream=True)
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith("text/html"):
+                    response.close()
+                    return ""
+                body = response.raw.read(_MAX_BODY_BYTES, decode_content=True)
+                text = self.extract_text_from_tree(_parse_html(body, response.encoding))
+            return text
         except Exception as e:
             print(f"Erreur lors du scraping de {url} : {e}")
             return ""
@@ -128,47 +266,104 @@ class WebScraper:
         filename = self.url_to_filename(url)
         filepath = os.path.join(output_dir, filename)
 
+        # Écriture directe via descripteur : un seul write par page, sans la
+        # couche d'IO bufferisée Python ni de print par fichier (qui
+        # sérialisait les workers sur le verrou stdout).
+        data = f"# {url}\n\n{content}".encode()
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(f"# {url}\n\n{content}")
-            print(f"✓ {filename}")
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
             return True
         except Exception as e:
             print(f"Erreur lors de la sauvegarde de {filename} : {e}")
             return False
 
+    def _load_manifest(self):
+        """Charge le manifeste du run précédent (absent ou corrompu = vide)."""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def _save_manifest(self):
+        """Persiste le nouveau manifeste (écriture atomique via os.replace)."""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.new_manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
     def setup_directories(self, md_dir: str, vector_dir: str):
-        """Prépare les répertoires de sortie (les vide s'ils existent)."""
-        os.makedirs(md_dir, exist_ok=True)
-        for file in os.listdir(md_dir):
-            file_path = os.path.join(md_dir, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+        """Prépare les répertoires de sortie.
 
+        Les .md existants sont conservés : les pages inchangées (304 ou hash
+        identique) sont réutilisées telles quelles, les autres sont réécrites.
+        L'index vectoriel est lui aussi conservé — WebAgent compare
+        l'empreinte du corpus et ne le reconstruit que si elle a changé.
+        """
+        os.makedirs(md_dir, exist_ok=True)
         os.makedirs(vector_dir, exist_ok=True)
-        for item in os.listdir(vector_dir):
-            item_path = os.path.join(vector_dir, item)
-            if os.path.isfile(item_path) or os.path.islink(item_path):
-                os.remove(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
 
     def scrape_all_pages(self, md_dir: str) -> int:
         """Scrape toutes les pages collectées et les sauvegarde."""
         print("\nScraping et création des fichiers .md...\n")
 
         saved_count = 0
-        total_links = len(self.found_links)
-
-        for i, url in enumerate(sorted(self.found_links), 1):
-            print(f"[{i}/{total_links}] ", end="")
-
-            content = self.scrape_page_content(url)
-            if self.save_page_as_markdown(url, content, md_dir):
+        urls = sorted(self.found_links)
+
+        # Les pages inchangées dont le .md existe déjà ne sont ni
+        # retéléchargées ni réécrites.
+        to_write = []
+        for url in urls:
+            if url in self.unchanged and os.path.exists(
+                os.path.join(md_dir, self.url_to_filename(url))
+            ):
                 saved_count += 1
+            else:
+                to_write.append(url)
+
+        if saved_count:
+            print(f"↻ {saved_count} pages inchangées réutilisées")
+
+        # Les téléchargements se font en parallèle, l'écriture des fichiers
+        # reste séquentielle (executor.map préserve l'ordre des URLs).
+        with ThreadPoolExecutor(max_workers=_FETCH_WORKERS) as executor:
+            contents = executor.map(self.scrape_page_content, to_write)
+            for i, (url, content) in enumerate(zip(to_write, contents), 1):
+                if self.save_page_as_markdown(url, content, md_dir):
+                    saved_count += 1
+                # Progression agrégée : une ligne toutes les 20 pages plutôt
+                # qu'un print par fichier.
+                if i % 20 == 0 or i == len(to_write):
+                    print(f"[{i}/{len(to_write)}] pages traitées")
 
         return saved_count
 
+    def prune_stale_markdown(self, md_dir: str) -> int:
+        """Supprime les .md des pages disparues du site.
+
+        Les .md existants étant conservés entre les runs, une page retirée
+        du site resterait sinon indéfiniment dans le corpus indexé.
+        """
+        keep = {
+            self.url_to_filename(url)
+            for url in self.found_links | set(self.new_manifest)
+        }
+        pruned = 0
+        for filename in os.listdir(md_dir):
+            if filename.endswith(".md") and filename not in keep:
+                try:
+                    os.remove(os.path.join(md_dir, filename))
+                    pruned += 1
+                except OSError as e:
+                    print(f"Erreur lors de la suppression de {filename} : {e}")
+        if pruned:
+            print(f"🗑 {pruned} pages obsolètes supprimées")
+        return pruned
+
     def run_full_scrape(
         self,
         md_dir: str = os.path.join(_ROOT_DIR, "chatbot/data/website_pages/"),
@@ -181,12 +376,16 @@ class WebScraper:
         print(f"📁 Répertoire de sortie : {md_dir}")
         print(f"🎯 Limite : {self.max_pages} pages\n")
 
+        self.manifest_path = os.path.join(md_dir, "manifest.json")
         self.setup_directories(md_dir, vector_dir)
+        self._load_manifest()
 
         self.collect_all_links()
         print(f"📊 {len(self.found_links)} liens uniques trouvés")
 
         saved_count = self.scrape_all_pages(md_dir)
+        self._save_manifest()
+        self.prune_stale_markdown(md_dir)
 
         print("\n✅ Scraping terminé !")
         print(f"📄 {saved_count} pages sauvegardées dans : {md_dir}")
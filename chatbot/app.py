@@ -7,6 +7,30 @@ from chatbot.pages.home import show_home
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+# CSS et pages déclarés au niveau module : la chaîne n'est pas reconstruite
+# et les objets st.Page ne sont pas réinstanciés à chaque rerun.
+_SIDEBAR_CSS = """
+    <style>
+    [data-testid="stSidebarNav"] {display: none}
+
+    .stButton > button {
+        width: 100%;
+        border-radius: 10px;
+        height: 50px;
+        margin: 5px 0;
+        font-weight: bold;
+    }
+
+    .stButton > button:hover {
+        background-color: #f0f2f6;
+        border-color: #1f77b4;
+    }
+    </style>
+    """
+
+HOME_PAGE = st.Page(show_home, title="Accueil", icon="🏠", default=True)
+CHATBOT_PAGE = st.Page(show_chatbot, title="Chatbot", icon="🤖")
+
 
 def main():
     """Main application function using st.Page and st.navigation."""
@@ -14,33 +38,9 @@ def main():
         page_title="Sup de Vinci - Chatbot", page_icon="🎓", layout="wide"
     )
 
-    st.markdown(
-        """
-        <style>
-        [data-testid="stSidebarNav"] {display: none}
-
-        .stButton > button {
-            width: 100%;
-            border-radius: 10px;
-            height: 50px;
-            margin: 5px 0;
-            font-weight: bold;
-        }
-
-        .stButton > button:hover {
-            background-color: #f0f2f6;
-            border-color: #1f77b4;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    home_page = st.Page(show_home, title="Accueil", icon="🏠", default=True)
-
-    chatbot_page = st.Page(show_chatbot, title="Chatbot", icon="🤖")
+    st.markdown(_SIDEBAR_CSS, unsafe_allow_html=True)
 
-    pg = st.navigation([home_page, chatbot_page])
+    pg = st.navigation([HOME_PAGE, CHATBOT_PAGE])
 
     with st.sidebar:
         st.title("🎓 Sup de Vinci")
@@ -49,9 +49,9 @@ def main():
         st.markdown("### 📍 Navigation")
 
         if st.button("🏠 Accueil", use_container_width=True):
-            st.switch_page(home_page)
+            st.switch_page(HOME_PAGE)
         if st.button("🤖 Chatbot", use_container_width=True):
-            st.switch_page(chatbot_page)
+            st.switch_page(CHATBOT_PAGE)
 
     pg.run()
 
@@ -1,10 +1,87 @@
+from collections import Counter, deque
 from datetime import datetime
+import time
 
 import streamlit as st
 
 from chatbot.agents.form_agent import CollectionState
 from chatbot.agents.main_agent import MainAgent
 
+# Streamlit rejoue tout le script à chaque interaction : borner l'historique
+# affiché garde un temps de rendu constant sur les longues sessions.
+_MAX_MESSAGES = 50
+
+_WELCOME_MESSAGE = """🎓 **Bonjour et bienvenue chez Sup de Vinci !**
+    \nJe suis votre assistant virtuel intelligent. Je peux vous aider avec :
+    \n\n🌐 **Informations sur l'école** : formations, admissions, campus, programmes
+    \n📚 **Documentation** : règlements, brochures, guides détaillés
+    \n📝 **Contact et candidatures** : collecte d'informations pour votre inscription
+    \n💬 **Questions générales** : tout ce qui concerne Sup de Vinci
+    \n\n**Comment puis-je vous aider aujourd'hui ?**"""
+
+_CUSTOM_CSS = """
+    <style>
+    .stChatMessage {
+        margin-bottom: 1rem;
+    }
+
+    .stProgress > div > div {
+        background-color: #1f77b4;
+    }
+
+    .metric-container {
+        background-color: #f0f2f6;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 0.5rem 0;
+    }
+
+    .chat-container {
+        max-height: 500px;
+        overflow-y: auto;
+    }
+
+    .success-message {
+        background-color: #d4edda;
+        border: 1px solid #c3e6cb;
+        color: #155724;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 1rem 0;
+    }
+
+    .error-message {
+        background-color: #f8d7da;
+        border: 1px solid #f5c6cb;
+        color: #721c24;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 1rem 0;
+    }
+
+    .stChatMessage[data-testid="chat-message-assistant"] {
+        background-color: #f8f9fa;
+    }
+
+    .agent-badge {
+        background-color: #e3f2fd;
+        padding: 2px 8px;
+        border-radius: 12px;
+        font-size: 12px;
+        margin-left: 5px;
+    }
+
+    .warning-box {
+        background-color: #fff3cd;
+        border: 1px solid #ffeaa7;
+        color: #856404;
+        padding: 0.75rem;
+        border-radius: 0.375rem;
+        margin: 0.5rem 0;
+    }
+    </style>
+    """
+
 
 def initialize_session_state():
     """Initialize session state for the enhanced chatbot"""
@@ -20,32 +97,19 @@ def initialize_session_state():
             st.session_state.init_error = str(e)
 
     if "messages" not in st.session_state:
-        st.session_state.messages = []
-        welcome_msg = get_welcome_message()
-        st.session_state.messages.append(
-            {
-                "role": "assistant",
-                "content": welcome_msg,
-                "timestamp": datetime.now(),
-                "agent_used": "main_agent",
-                "intent": "greeting",
-            }
-        )
-
-    if "conversation_mode" not in st.session_state:
-        st.session_state.conversation_mode = "general"
-
-    if "input_disabled" not in st.session_state:
-        st.session_state.input_disabled = False
-
-    if "error_count" not in st.session_state:
-        st.session_state.error_count = 0
+        st.session_state.messages = deque(maxlen=_MAX_MESSAGES)
+        st.session_state.messages.append(_welcome_entry())
 
+    st.session_state.setdefault("conversation_mode", "general")
+    st.session_state.setdefault("input_disabled", False)
+    st.session_state.setdefault("error_count", 0)
     if "chat_stats" not in st.session_state:
         st.session_state.chat_stats = {
             "total_messages": 0,
-            "intents_detected": [],
-            "agents_used": [],
+            # Compteurs plutôt que listes : mémoire en O(types d'intentions)
+            # et non en O(messages de la session).
+            "intents_detected": Counter(),
+            "agents_used": Counter(),
             "successful_responses": 0,
             "failed_responses": 0,
         }
@@ -53,13 +117,54 @@ def initialize_session_state():
 
 def get_welcome_message():
     """Get welcome message for the chatbot"""
-    return """🎓 **Bonjour et bienvenue chez Sup de Vinci !**
-    \nJe suis votre assistant virtuel intelligent. Je peux vous aider avec :
-    \n\n🌐 **Informations sur l'école** : formations, admissions, campus, programmes
-    \n📚 **Documentation** : règlements, brochures, guides détaillés
-    \n📝 **Contact et candidatures** : collecte d'informations pour votre inscription
-    \n💬 **Questions générales** : tout ce qui concerne Sup de Vinci
-    \n\n**Comment puis-je vous aider aujourd'hui ?**"""
+    return _WELCOME_MESSAGE
+
+
+def _welcome_entry():
+    """Build the assistant welcome entry appended on init and reset."""
+    return {
+        "role": "assistant",
+        "content": _WELCOME_MESSAGE,
+        "timestamp": datetime.now(),
+        "agent_used": "main_agent",
+        "intent": "greeting",
+    }
+
+
+def _stream_into(placeholder, token_iter):
+    """Write a token stream into a placeholder with a throttled publish gate.
+
+    Les tokens sont accumulés localement et publiés au plus toutes les
+    50 ms et par paquets d'au moins 8 caractères : le front met à jour la
+    bulle à ~20 Hz quel que soit le débit du modèle, au lieu d'un re-parse
+    markdown par token.
+    """
+    buffer = ""
+    last_publish = 0.0
+    last_length = 0
+    for token in token_iter:
+        buffer += token
+        now = time.monotonic()
+        if now - last_publish >= 0.05 and len(buffer) - last_length >= 8:
+            placeholder.markdown(buffer)
+            last_publish = now
+            last_length = len(buffer)
+    placeholder.markdown(buffer)
+    return buffer
+
+
+_AGENT_AVATARS = {
+    "web_agent": "🌐",
+    "doc_agent": "📚",
+    "action_agent": "📝",
+    "main_agent": "🤖",
+}
+
+_AGENT_NAMES = {
+    "web_agent": "Agent Site Web",
+    "doc_agent": "Agent Documentation",
+    "action_agent": "Agent Contact",
+}
 
 
 def display_message(message, is_user=False):
@@ -69,70 +174,55 @@ def display_message(message, is_user=False):
             st.write(message["content"])
     else:
         agent_used = message.get("agent_used", "main_agent")
-
-        agent_avatars = {
-            "web_agent": "🌐",
-            "doc_agent": "📚",
-            "action_agent": "📝",
-            "main_agent": "🤖",
-        }
-
-        avatar = agent_avatars.get(agent_used, "🤖")
+        avatar = _AGENT_AVATARS.get(agent_used, "🤖")
 
         with st.chat_message("assistant", avatar=avatar):
             if agent_used != "main_agent":
-                agent_names = {
-                    "web_agent": "Agent Site Web",
-                    "doc_agent": "Agent Documentation",
-                    "action_agent": "Agent Contact",
-                }
-                st.caption(f"🏷️ {agent_names.get(agent_used, agent_used)}")
+                st.caption(f"🏷️ {_AGENT_NAMES.get(agent_used, agent_used)}")
 
             st.markdown(message["content"])
 
 
+_STEPS = (
+    ("Accueil", CollectionState.GREETING),
+    ("Nom", CollectionState.COLLECTING_NAME),
+    ("Prénom", CollectionState.COLLECTING_FIRSTNAME),
+    ("Téléphone", CollectionState.COLLECTING_PHONE),
+    ("Email", CollectionState.COLLECTING_EMAIL),
+    ("Terminé", CollectionState.COMPLETED),
+)
+
+_STATE_TO_INDEX = {state: i for i, (_, state) in enumerate(_STEPS)}
+
+
 def display_progress_indicator():
     """Display progress indicator for information collection"""
-    try:
-        if (
-            st.session_state.agent_initialized
-            and hasattr(st.session_state.unified_agent, "information_collector")
-            and st.session_state.unified_agent.information_collector
-        ):
-            collector = st.session_state.unified_agent.information_collector
-            current_state = getattr(collector, "current_state", None)
-
-            if current_state and current_state != CollectionState.GREETING:
-                st.sidebar.markdown("### 📋 Progression")
-
-                steps = [
-                    ("Accueil", CollectionState.GREETING),
-                    ("Nom", CollectionState.COLLECTING_NAME),
-                    ("Prénom", CollectionState.COLLECTING_FIRSTNAME),
-                    ("Téléphone", CollectionState.COLLECTING_PHONE),
-                    ("Email", CollectionState.COLLECTING_EMAIL),
-                    ("Terminé", CollectionState.COMPLETED),
-                ]
-
-                current_step = 0
-                for i, (_, state) in enumerate(steps):
-                    if current_state == state:
-                        current_step = i
-                        break
-
-                progress = current_step / (len(steps) - 1)
-                st.sidebar.progress(progress)
-
-                for i, (step_name, _) in enumerate(steps):
-                    if i < current_step:
-                        st.sidebar.markdown(f"✅ {step_name}")
-                    elif i == current_step:
-                        st.sidebar.markdown(f"🔄 **{step_name}**")
-                    else:
-                        st.sidebar.markdown(f"⏳ {step_name}")
+    if not st.session_state.agent_initialized:
+        return
+
+    # Sentinelle O(1) côté agent : None tant qu'aucune collecte n'a démarré,
+    # sans déclencher la construction paresseuse du FormAgent.
+    current_state = st.session_state.unified_agent.collection_state
+    if current_state is None or current_state == CollectionState.GREETING:
+        return
+
+    st.sidebar.markdown("### 📋 Progression")
 
+    current_step = _STATE_TO_INDEX.get(current_state, 0)
+
+    try:
+        st.sidebar.progress(current_step / (len(_STEPS) - 1))
     except Exception as e:
         st.sidebar.error(f"Erreur progression: {e}")
+        return
+
+    for i, (step_name, _) in enumerate(_STEPS):
+        if i < current_step:
+            st.sidebar.markdown(f"✅ {step_name}")
+        elif i == current_step:
+            st.sidebar.markdown(f"🔄 **{step_name}**")
+        else:
+            st.sidebar.markdown(f"⏳ {step_name}")
 
 
 def handle_completion():
@@ -144,20 +234,11 @@ def handle_completion():
         if st.button(
             "🆕 Nouvelle conversation", type="primary", use_container_width=True
         ):
-            st.session_state.messages = []
+            st.session_state.messages = deque(maxlen=_MAX_MESSAGES)
             if st.session_state.agent_initialized:
                 st.session_state.unified_agent.reset_conversation()
 
-            welcome_msg = get_welcome_message()
-            st.session_state.messages.append(
-                {
-                    "role": "assistant",
-                    "content": welcome_msg,
-                    "timestamp": datetime.now(),
-                    "agent_used": "main_agent",
-                    "intent": "greeting",
-                }
-            )
+            st.session_state.messages.append(_welcome_entry())
 
             st.session_state.input_disabled = False
             st.session_state.conversation_mode = "general"
@@ -167,71 +248,9 @@ def handle_completion():
 
 def inject_custom_css():
     """Inject custom CSS for better styling"""
-    st.markdown(
-        """
-    <style>
-    .stChatMessage {
-        margin-bottom: 1rem;
-    }
-
-    .stProgress > div > div {
-        background-color: #1f77b4;
-    }
-
-    .metric-container {
-        background-color: #f0f2f6;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-    }
-
-    .chat-container {
-        max-height: 500px;
-        overflow-y: auto;
-    }
-
-    .success-message {
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-
-    .error-message {
-        background-color: #f8d7da;
-        border: 1px solid #f5c6cb;
-        color: #721c24;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-
-    .stChatMessage[data-testid="chat-message-assistant"] {
-        background-color: #f8f9fa;
-    }
-
-    .agent-badge {
-        background-color: #e3f2fd;
-        padding: 2px 8px;
-        border-radius: 12px;
-        font-size: 12px;
-        margin-left: 5px;
-    }
-
-    .warning-box {
-        background-color: #fff3cd;
-        border: 1px solid #ffeaa7;
-        color: #856404;
-        padding: 0.75rem;
-        border-radius: 0.375rem;
-        margin: 0.5rem 0;
-    }
-    </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    # La feuille de style est une constante module ; Streamlit exige
+    # qu'elle soit ré-émise à chaque rerun complet pour rester appliquée.
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
 
 
 def show_chatbot():
@@ -239,9 +258,6 @@ def show_chatbot():
     inject_custom_css()
     initialize_session_state()
 
-    if "processing_message" not in st.session_state:
-        st.session_state.processing_message = False
-
     st.title("🤖 Assistant Virtuel Sup de Vinci")
     st.markdown("## 💬 Conversation Multi-Agents")
 
@@ -261,100 +277,137 @@ def show_chatbot():
 
         return
 
+    _chat_panel()
+
+    if st.session_state.conversation_mode == "completed":
+        st.markdown("---")
+        st.success("🎉 Collecte d'informations terminée avec succès!")
+        handle_completion()
+
+    display_progress_indicator()
+
+
+@st.fragment
+def _chat_panel():
+    """Chat area isolated in a fragment: a message turn reruns only this
+    function, not the whole page (title, CSS, sidebar)."""
     chat_container = st.container()
     with chat_container:
         for message in st.session_state.messages:
             display_message(message, message["role"] == "user")
 
-    if not st.session_state.input_disabled:
-        user_input = st.chat_input(
-            placeholder="Posez votre question sur Sup de Vinci...",
-            disabled=st.session_state.processing_message,
-        )
+    if st.session_state.input_disabled:
+        return
 
-        if user_input and not st.session_state.processing_message:
-            st.session_state.messages.append(
-                {"role": "user", "content": user_input, "timestamp": datetime.now()}
-            )
-            st.session_state.chat_stats["total_messages"] += 1
-            st.session_state.processing_message = True
-            st.rerun()
+    user_input = st.chat_input(placeholder="Posez votre question sur Sup de Vinci...")
+    if not user_input:
+        return
 
-    if st.session_state.processing_message and len(st.session_state.messages) > 0:
-        user_input = st.session_state.messages[-1]["content"]
+    # Tout le tour se joue en une seule exécution : message utilisateur
+    # affiché immédiatement, réponse générée sous le spinner, puis un seul
+    # rerun — au lieu d'un aller-retour complet par étape.
+    user_message = {
+        "role": "user",
+        "content": user_input,
+        "timestamp": datetime.now(),
+    }
+    st.session_state.messages.append(user_message)
+    st.session_state.chat_stats["total_messages"] += 1
+    with chat_container:
+        display_message(user_message, is_user=True)
 
-        try:
+    needs_full_rerun = False
+    try:
+        agent = st.session_state.unified_agent
+        # Les tours généraux passent par le flux token par token : la
+        # latence perçue tombe au premier token. Les autres intentions
+        # gardent le tour synchrone complet (routage, collecte, statut).
+        intent = agent.detect_intent(user_input)
+        if intent == "general":
+            with chat_container, st.chat_message("assistant", avatar="🤖"):
+                placeholder = st.empty()
+                content = _stream_into(
+                    placeholder, agent.stream_general_response(user_input)
+                )
+            response = {
+                "response": content,
+                "intent": intent,
+                "agent_used": "main_agent",
+                "success": True,
+            }
+        else:
             with st.spinner("🤔 L'assistant analyse votre demande..."):
-                response = st.session_state.unified_agent.generate_response(user_input)
+                response = agent.generate_response(user_input)
 
-            if response.get("success", True):
-                st.session_state.chat_stats["successful_responses"] += 1
-            else:
-                st.session_state.chat_stats["failed_responses"] += 1
-                st.session_state.error_count += 1
+        if response.get("success", True):
+            st.session_state.chat_stats["successful_responses"] += 1
+        else:
+            st.session_state.chat_stats["failed_responses"] += 1
+            st.session_state.error_count += 1
 
-            bot_message = {
-                "role": "assistant",
-                "content": response["response"],
-                "timestamp": datetime.now(),
-                "agent_used": response.get("agent_used", "main_agent"),
-                "intent": response.get("intent", "general"),
-            }
+        bot_message = {
+            "role": "assistant",
+            "content": response["response"],
+            "timestamp": datetime.now(),
+            "agent_used": response.get("agent_used", "main_agent"),
+            "intent": response.get("intent", "general"),
+        }
 
-            st.session_state.messages.append(bot_message)
+        st.session_state.messages.append(bot_message)
+
+        st.session_state.chat_stats["intents_detected"][
+            response.get("intent", "unknown")
+        ] += 1
+        st.session_state.chat_stats["agents_used"][
+            response.get("agent_used", "unknown")
+        ] += 1
+
+        collection_status = response.get("collection_status", {})
+        if collection_status.get("complete"):
+            st.session_state.input_disabled = True
+            st.session_state.conversation_mode = "completed"
+        # La barre de progression de la collecte vit hors du fragment : tant
+        # que la collecte est active, chaque tour doit la rafraîchir.
+        needs_full_rerun = bool(
+            collection_status.get("active") or collection_status.get("complete")
+        )
 
-            st.session_state.chat_stats["intents_detected"].append(
-                response.get("intent", "unknown")
-            )
-            st.session_state.chat_stats["agents_used"].append(
-                response.get("agent_used", "unknown")
+        if response.get("intent") == "contact" and not collection_status.get("active"):
+            st.success(
+                "✨ Processus de contact initié ! Suivez les instructions ci-dessus."
             )
 
-            collection_status = response.get("collection_status", {})
-            if collection_status.get("complete"):
-                st.session_state.input_disabled = True
-                st.session_state.conversation_mode = "completed"
+    except Exception:
+        st.session_state.error_count += 1
+        st.session_state.chat_stats["failed_responses"] += 1
 
-            if response.get("intent") == "contact" and not collection_status.get(
-                "active"
-            ):
-                st.success(
-                    "✨ Processus de contact initié ! Suivez les instructions ci-dessus."
-                )
+        error_msg = "Une erreur inattendue s'est produite. Notre équipe technique a été notifiée."
 
-        except Exception:
-            st.session_state.error_count += 1
-            st.session_state.chat_stats["failed_responses"] += 1
+        fallback_response = """Je rencontre une difficulté technique, mais je peux tout de même vous aider !
+        \n\n🎓 **Pour les formations** : Sup de Vinci propose des Mastères en informatique avec plusieurs spécialisations
+        \n📞 **Pour nous contacter** : 01.23.45.67.89 ou contact@supdevinci.fr
+        \n📧 **Pour candidater** : Utilisez notre formulaire en ligne ou contactez-nous directement
+        \n\nQue puis-je faire d'autre pour vous aider ?"""
 
-            error_msg = "Une erreur inattendue s'est produite. Notre équipe technique a été notifiée."
-
-            fallback_response = """Je rencontre une difficulté technique, mais je peux tout de même vous aider !
-            \n\n🎓 **Pour les formations** : Sup de Vinci propose des Mastères en informatique avec plusieurs spécialisations
-            \n📞 **Pour nous contacter** : 01.23.45.67.89 ou contact@supdevinci.fr
-            \n📧 **Pour candidater** : Utilisez notre formulaire en ligne ou contactez-nous directement
-            \n\nQue puis-je faire d'autre pour vous aider ?"""
-
-            st.session_state.messages.append(
-                {
-                    "role": "assistant",
-                    "content": fallback_response,
-                    "timestamp": datetime.now(),
-                    "agent_used": "main_agent",
-                    "intent": "error",
-                }
-            )
+        st.session_state.messages.append(
+            {
+                "role": "assistant",
+                "content": fallback_response,
+                "timestamp": datetime.now(),
+                "agent_used": "main_agent",
+                "intent": "error",
+            }
+        )
 
-            st.error(error_msg)
+        st.error(error_msg)
 
-        st.session_state.processing_message = False
+    # La collecte modifie l'UI hors du fragment (barre de progression,
+    # bandeau de complétion) : rerun complet dans ces cas-là, rerun limité
+    # au fragment pour les tours de conversation ordinaires.
+    if needs_full_rerun or st.session_state.conversation_mode == "completed":
         st.rerun()
-
-    if st.session_state.conversation_mode == "completed":
-        st.markdown("---")
-        st.success("🎉 Collecte d'informations terminée avec succès!")
-        handle_completion()
-
-    display_progress_indicator()
+    else:
+        st.rerun(scope="fragment")
 
 
 if __name__ == "__main__":
@@ -1,3 +1,14 @@
 from .get_env_var import get_env_variable
 
-__all__ = ["get_env_variable"]
+__all__ = ["QuantizedOnnxEmbeddings", "get_env_variable"]
+
+
+def __getattr__(name):
+    # Ré-export paresseux (PEP 562) : importer get_env_variable ne doit pas
+    # charger transformers/onnxruntime — la pile d'embedding n'est payée que
+    # par le premier agent qui la demande.
+    if name == "QuantizedOnnxEmbeddings":
+        from .onnx_embeddings import QuantizedOnnxEmbeddings
+
+        return QuantizedOnnxEmbeddings
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,33 @@
+import functools
 import os
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-env_path = Path(__file__).parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
 
+@functools.lru_cache(maxsize=None)
+def _ensure_env_loaded() -> None:
+    """
+    Parse the ``.env`` file exactly once per process.
+
+    Le chargement est différé au premier ``get_env_variable`` : importer ce
+    module (ce que fait chaque agent) ne paie plus la résolution de chemin
+    ni le parsing du fichier, et les imports suivants ne refont rien.
+    """
+    env_path = Path(__file__).resolve().parents[2] / ".env"
+    load_dotenv(dotenv_path=env_path)
 
+
+@functools.lru_cache(maxsize=None)
 def get_env_variable(var_name: str) -> str:
     """
     Get the value of an environment variable.
 
+    Values are memoized after the first lookup, so repeated calls (e.g.
+    the four Azure variables read per agent construction) skip the
+    ``os.environ`` lookup and validation. Missing variables are not
+    cached and keep raising on every call.
+
     Parameters
     ----------
     var_name : str
@@ -26,6 +43,7 @@ def get_env_variable(var_name: str) -> str:
     ValueError
         If the environment variable is not set.
     """
+    _ensure_env_loaded()
     value = os.getenv(var_name)
     if value is None:
         raise ValueError(f"Environment variable {var_name} is not set.")
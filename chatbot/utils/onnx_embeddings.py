@@ -0,0 +1,130 @@
+import os
+from typing import List
+
+from langchain.embeddings.base import Embeddings
+import numpy as np
+import onnxruntime
+from optimum.onnxruntime import (
+    ORTModelForFeatureExtraction,
+    ORTOptimizer,
+    ORTQuantizer,
+)
+from optimum.onnxruntime.configuration import (
+    AutoQuantizationConfig,
+    OptimizationConfig,
+)
+from transformers import AutoTokenizer
+
+_OPTIMIZED_FILENAME = "model_optimized.onnx"
+_QUANTIZED_FILENAME = "model_optimized_quantized.onnx"
+
+
+def _session_options() -> onnxruntime.SessionOptions:
+    """
+    Options de session ONNX : tous les cœurs sur le parallélisme intra-op
+    (les matmuls d'un forward) et exécution séquentielle inter-op, pour
+    éviter la sur-souscription des threads qui dégrade le débit CPU.
+    Le nombre de threads est surchargeable via EMBED_THREADS.
+    """
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = int(os.getenv("EMBED_THREADS", os.cpu_count() or 1))
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return options
+
+
+class QuantizedOnnxEmbeddings(Embeddings):
+    """
+    Modèle d'embedding sentence-transformers exporté en ONNX et quantifié en
+    int8 dynamique (AVX-512 VNNI), exposé avec l'interface LangChain
+    `Embeddings` pour rester interchangeable avec `HuggingFaceEmbeddings`.
+
+    Le modèle quantifié est mis en cache sur disque : la quantification n'a
+    lieu qu'au premier lancement, les suivants rechargent directement le
+    fichier `.onnx`.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        cache_directory: str = "chatbot/data/vectorstore/embed_int8",
+        batch_size: int = 32,
+    ):
+        self.model_name = model_name
+        self.cache_directory = cache_directory
+        self.batch_size = batch_size
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = self._load_or_quantize()
+
+    def _load_or_quantize(self) -> ORTModelForFeatureExtraction:
+        """Charge le modèle int8 depuis le cache, ou le quantifie puis le persiste."""
+        quantized_path = os.path.join(self.cache_directory, _QUANTIZED_FILENAME)
+        if os.path.exists(quantized_path):
+            return ORTModelForFeatureExtraction.from_pretrained(
+                self.cache_directory,
+                file_name=_QUANTIZED_FILENAME,
+                session_options=_session_options(),
+            )
+
+        print(f"Optimisation et quantification int8 de {self.model_name}...")
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            self.model_name, export=True
+        )
+
+        # Passe d'optimisation de graphe (fusions spécifiques transformers)
+        # avant la quantification : les kernels fusionnés réduisent la bande
+        # passante mémoire, principal goulot des activations sur CPU.
+        optimizer = ORTOptimizer.from_pretrained(model)
+        optimizer.optimize(
+            save_dir=self.cache_directory,
+            optimization_config=OptimizationConfig(
+                optimization_level=99,
+                enable_transformers_specific_optimizations=True,
+                fp16=False,
+            ),
+        )
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            self.cache_directory, file_name=_OPTIMIZED_FILENAME
+        )
+
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantization_config = AutoQuantizationConfig.avx512_vnni(
+            is_static=False, per_channel=False
+        )
+        quantizer.quantize(
+            save_dir=self.cache_directory,
+            quantization_config=quantization_config,
+        )
+        self.tokenizer.save_pretrained(self.cache_directory)
+        return ORTModelForFeatureExtraction.from_pretrained(
+            self.cache_directory,
+            file_name=_QUANTIZED_FILENAME,
+            session_options=_session_options(),
+        )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Tokenise, encode, applique mean-pooling puis normalisation L2."""
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            return_tensors="np",
+        )
+        outputs = self.model(**encoded)
+        token_embeddings = outputs.last_hidden_state
+        mask = np.expand_dims(encoded["attention_mask"], -1).astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), a_min=1e-9, a_max=None)
+        embeddings = summed / counts
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.clip(norms, a_min=1e-12, a_max=None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            embeddings.extend(self._encode(batch).tolist())
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()